@@ -1,43 +1,234 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-import argparse, math, time, warnings
+import argparse, heapq, math, os, queue, select, sys, threading, time, warnings
 from collections import deque
 from datetime import datetime
+from statistics import median_high
+
+import numpy as np
+
+_asarray = np.asarray  # 模块级绑定，热路径免去 np 上的属性查找
 
 warnings.filterwarnings("ignore", category=RuntimeWarning, module="acconeer.exptool")
 
 from acconeer.exptool.a111 import Client, IQServiceConfig
 from acconeer.exptool.a111.algo.sleep_breathing import _processor as sb
+from frame_kernel import process_frame
+
+class RollingMedian:
+    """滑窗中位数：双堆 + 懒删除，插入 O(log N)、取值 O(1)。
+
+    median() 取上中位数，与原先 sorted(q)[len(q)//2] 结果一致。
+    """
+    def __init__(self, window):
+        self.window = window
+        self.order = deque()      # 插入顺序，用于滑出窗口
+        self.lo = []              # 下半区：取负存储的最大堆
+        self.hi = []              # 上半区：最小堆（堆顶即中位数）
+        self.lo_size = 0
+        self.hi_size = 0
+        self.delayed = {}         # 懒删除计数：值 -> 待删个数
+
+    def _prune(self, heap):
+        # 弹掉堆顶的懒删除元素，保证两个堆顶永远是有效值
+        sign = -1 if heap is self.lo else 1
+        while heap:
+            v = sign * heap[0]
+            if v not in self.delayed:
+                break
+            self.delayed[v] -= 1
+            if not self.delayed[v]:
+                del self.delayed[v]
+            heapq.heappop(heap)
+
+    def _rebalance(self):
+        # 不变式：lo_size == hi_size 或 lo_size == hi_size + 1
+        if self.lo_size > self.hi_size + 1:
+            heapq.heappush(self.hi, -heapq.heappop(self.lo))
+            self.lo_size -= 1; self.hi_size += 1
+            self._prune(self.lo)
+        elif self.lo_size < self.hi_size:
+            heapq.heappush(self.lo, -heapq.heappop(self.hi))
+            self.hi_size -= 1; self.lo_size += 1
+            self._prune(self.hi)
+
+    def push(self, x):
+        self.order.append(x)
+        if not self.lo or x <= -self.lo[0]:
+            heapq.heappush(self.lo, -x); self.lo_size += 1
+        else:
+            heapq.heappush(self.hi, x); self.hi_size += 1
+        self._rebalance()
+        if len(self.order) > self.window:
+            old = self.order.popleft()
+            self.delayed[old] = self.delayed.get(old, 0) + 1
+            if old <= -self.lo[0]:
+                self.lo_size -= 1
+                if old == -self.lo[0]:
+                    self._prune(self.lo)
+            else:
+                self.hi_size -= 1
+                if self.hi and old == self.hi[0]:
+                    self._prune(self.hi)
+            self._rebalance()
+
+    def median(self):
+        # 偶数个取上中位数（与 sorted(q)[len(q)//2] 对齐）
+        if self.lo_size == self.hi_size:
+            return self.hi[0]
+        return -self.lo[0]
+
+    def __len__(self):
+        return len(self.order)
+
+class SmallMedian:
+    """小窗口中位数：deque + statistics.median_high，常数开销比双堆小。
+
+    median_high 与 sorted(q)[len(q)//2] 一样取上中位数；
+    median_low 在偶数窗口会低一档，所以不用。
+    """
+    __slots__ = ("q",)
+
+    def __init__(self, window):
+        self.q = deque(maxlen=window)
+
+    def push(self, x):
+        self.q.append(x)
+
+    def median(self):
+        return median_high(self.q)
+
+class RingBpm:
+    """均值平滑用的定长环形缓冲：连续存储，push 零分配。"""
+    __slots__ = ("buf", "n", "count", "idx")
+
+    def __init__(self, window):
+        self.buf = np.empty(window, dtype=np.float32)
+        self.n = window
+        self.count = 0
+        self.idx = 0
+
+    def push(self, x):
+        self.buf[self.idx] = x
+        self.idx = (self.idx + 1) % self.n
+        if self.count < self.n:
+            self.count += 1
+
+    def mean(self):
+        return float(self.buf[:self.count].mean())
+
+_isfinite = math.isfinite
 
 def safe_float(x):
+    # 快路径：结果 dict 里的值几乎全是 float/int，先做 C 级指针比较，
+    # 不进异常机制；其余类型（numpy 标量、字符串等）再走原 try/except
+    if type(x) is float:
+        return x if _isfinite(x) else None
+    if type(x) is int:
+        return float(x)
     if isinstance(x, bool):
         return None
     try:
         v = float(x)
-        return v if math.isfinite(v) else None
+        return v if _isfinite(v) else None
     except:
         return None
 
-def bpm_from_res(res):
-    """优先 f_est，其次 f_dft_est；再兜底可能的 *_hz / *_bpm。"""
-    if not isinstance(res, dict):
-        return None
-    for k in ("f_est","f_dft_est","breathing_rate_hz","freq_hz","f_hat","resp_rate_hz"):
-        v = safe_float(res.get(k))
-        if v is not None:
-            return v * 60.0
-    for k in ("breathing_rate_bpm","respiratory_rate_bpm","bpm"):
-        v = safe_float(res.get(k))
-        if v is not None:
-            return v
+def _log_writer(log_q, csv_fh):
+    """后台写线程：主循环只入队，write/flush 的阻塞不再卡采样路径。
+
+    stdout 每 8 行刷一次，CSV 每 32 行刷一次（与之前的批量节奏一致）；
+    收到 None 哨兵后补刷并退出。
+    """
+    out = sys.stdout
+    n_out = 0
+    n_csv = 0
+    while True:
+        item = log_q.get()
+        if item is None:
+            break
+        out.write(item)
+        n_out += 1
+        if n_out >= 8:
+            out.flush()
+            n_out = 0
+        if csv_fh:
+            csv_fh.write(item)
+            n_csv += 1
+            if n_csv >= 32:
+                csv_fh.flush()
+                n_csv = 0
+    out.flush()
+    if csv_fh:
+        csv_fh.flush()
+
+def _find_sock(client):
+    """尽力拿到 Client 底层 socket；拿不到返回 None（退化为纯阻塞取帧）。"""
+    for attr in ("_link", "link"):
+        link = getattr(client, attr, None)
+        if link is not None:
+            sock = getattr(link, "_sock", None)
+            if sock is not None:
+                return sock
     return None
 
-def norm_init_progress(res):
-    raw = res.get("init_progress") if isinstance(res, dict) else None
-    ip = safe_float(raw)
+def fetch_available(client, sock, max_n=4):
+    """阻塞取一帧后，把 socket 上已就绪的帧一并取出成批处理。
+
+    recv 与上一帧的处理重叠，select 超时 0 不增加阻塞；
+    12 Hz 下收益很小，但高 update_rate 配置直接受益。
+    """
+    batch = [client.get_next()]
+    if sock is not None:
+        try:
+            while len(batch) < max_n and select.select([sock], [], [], 0)[0]:
+                batch.append(client.get_next())
+        except Exception:
+            pass
+    return batch
+
+# BPM 候选键：优先 *_hz（×60），兜底 *_bpm
+_KEYS_HZ = ("f_est","f_dft_est","breathing_rate_hz","freq_hz","f_hat","resp_rate_hz")
+_KEYS_BPM = ("breathing_rate_bpm","respiratory_rate_bpm","bpm")
+_EMPTY_FIELDS = (None, 1.0, None, None)
+
+# 单槽记忆：处理器若跨帧返回同一个结果 dict，直接复用上一帧的解包结果。
+# 持有上一帧 res 的强引用做 is 比较——比裸 id() 安全，地址复用不会误命中。
+_last_res = None
+_last_fields = _EMPTY_FIELDS
+
+def extract(res):
+    """一次类型判断取出每帧所需字段，返回 (raw_bpm, ip, snr_raw, ps)。
+
+    替代原先 bpm_from_res / norm_init_progress / 各处
+    isinstance(res, dict) and res.get(...) 的重复判断。
+    """
+    global _last_res, _last_fields
+    if res is _last_res and res is not None:
+        return _last_fields
+    if type(res) is not dict:
+        return _EMPTY_FIELDS
+    g = res.get
+    raw_bpm = None
+    for k in _KEYS_HZ:
+        v = safe_float(g(k))
+        if v is not None:
+            raw_bpm = v * 60.0
+            break
+    if raw_bpm is None:
+        for k in _KEYS_BPM:
+            v = safe_float(g(k))
+            if v is not None:
+                raw_bpm = v
+                break
+    ip = safe_float(g("init_progress"))
     if ip is None:
-        return 1.0
-    return ip/100.0 if ip > 1.0 else ip
+        ip = 1.0
+    elif ip > 1.0:
+        ip = ip / 100.0   # 百分比 → 0-1
+    _last_res = res
+    _last_fields = (raw_bpm, ip, safe_float(g("snr")), g("power_spectrum"))
+    return _last_fields
 
 def main():
     ap = argparse.ArgumentParser("A111 IQ sleep-breathing (stable 1Hz logging)")
@@ -65,6 +256,18 @@ def main():
 
     args = ap.parse_args()
 
+    # 循环不变量提前算好，热路径里全部走 LOAD_FAST
+    bpm_lo = 60.0 * args.f_low
+    bpm_hi = 60.0 * args.f_high
+    snr_min = args.snr_min
+    prom_min = args.prominence_min
+    max_step = args.max_step_bpm
+    max_ratio = args.max_ratio
+    inv_max_ratio = 1.0 / args.max_ratio
+    hold_for = args.hold_last_for
+    use_median = (args.smooth == "median")
+    debug = args.debug
+
     client = Client(protocol="exploration", link="socket", host=args.host)
 
     cfg = IQServiceConfig()
@@ -87,122 +290,137 @@ def main():
     pc.lambda_p, pc.lambda_05 = 40.0, 1.0
     proc = sb.Processor(cfg, pc, sess)
 
+    # stdout 改块缓冲：1Hz 行攒 8 条刷一次，管道落日志时少 8 倍 write 系统调用
+    try:
+        sys.stdout.reconfigure(line_buffering=False)
+    except Exception:
+        pass
     print("time_hms,unix_s,bpm,note")
-    
+    sys.stdout.flush()
+
     csv_fh = None
-    if args.out_csv:
-        csv_fh = open(args.out_csv, "a", buffering=1)
+    if args.out:
+        csv_fh = open(args.out, "a", buffering=65536)
         csv_fh.write("time_hms,unix_s,bpm,note\n")
-    
-    q = deque(maxlen=args.smooth_window)
+
+    # 输出走后台线程：主循环 put 完即回到取帧
+    log_q = queue.SimpleQueue()
+    writer = threading.Thread(target=_log_writer, args=(log_q, csv_fh), daemon=True)
+    writer.start()
+
+    if use_median:
+        # 默认窗口 N=5 这种量级 median_high 更划算；窗口大了才值得上双堆
+        if args.smooth_window <= 8:
+            q = SmallMedian(args.smooth_window)
+        else:
+            q = RollingMedian(args.smooth_window)
+    else:
+        q = RingBpm(args.smooth_window)
     last_good_bpm = None
     last_good_t = 0.0
 
-    t0 = time.time()
-    next_tick = math.floor(t0) + 1
+    # 预热内核：进循环前付一次 JIT 编译开销
+    process_frame(np.zeros(16, dtype=np.float64), snr_min)
+
+    # 预热处理器：首帧会触发内部按 n_dft/D 分配缓冲与懒初始化，
+    # 先喂几帧把一次性开销挡在计时循环外（别删，删了首秒会抖）
+    for _ in range(3):
+        info, data = client.get_next()
+        proc.process(data, info)
+
+    # 调度走单调时钟（系统对时不会打乱 1Hz 节拍）；墙钟只在输出时换算
+    mono0 = time.monotonic()
+    wall0 = time.time()
+    next_tick = mono0 + (math.floor(wall0) + 1.0 - wall0)  # 对齐整数墙钟秒
+    _fromtimestamp = datetime.fromtimestamp  # 热路径少一次属性查找
     debug_keys_printed = False
 
+    sock = _find_sock(client)
+
     try:
         while True:
-            info, data = client.get_next()
-            res = proc.process(data, info)
-
-            if args.debug and (not debug_keys_printed) and isinstance(res, dict):
-                print("[DEBUG] keys:", sorted(res.keys()))
-                debug_keys_printed = True
-
-            # 估计量
-            ip = norm_init_progress(res)
-            raw_bpm = bpm_from_res(res)
-
-            # ----- 自定义 SNR（峰值/噪声中位数） -----
-            ps = res.get("power_spectrum") if isinstance(res, dict) else None
-            snr = None
-            try:
-                import numpy as np
-                if ps is not None:
-                    ps = np.asarray(ps, dtype=float)
-                    if np.all(np.isfinite(ps)) and ps.size > 8 and np.any(ps > 0):
-                        peak_i = int(np.nanargmax(ps))
-                        lo = max(0, peak_i-2)
-                        hi = min(ps.size, peak_i+3)
-                        mask = np.ones(ps.shape[0], dtype=bool)
-                        mask[lo:hi] = False
-                        noise = ps[mask]
-                        noise = noise[noise > 0]
-                        if noise.size > 0:
-                            snr = 10.0 * math.log10(ps[peak_i] / np.median(noise))
-            except Exception:
-                snr = None
+            for info, data in fetch_available(client, sock):
+                res = proc.process(data, info)
+
+                if debug and (not debug_keys_printed) and isinstance(res, dict):
+                    print("[DEBUG] keys:", sorted(res.keys()))
+                    debug_keys_printed = True
 
-            if snr is None:
-                snr = safe_float(isinstance(res, dict) and res.get("snr"))
-
-            now = time.time()
-            bpm_lo, bpm_hi = 60.0*args.f_low, 60.0*args.f_high
-
-            # 基础有效性
-            valid = (
-                (ip is None or ip >= 0.99) and
-                (snr is None or snr >= args.snr_min) and
-                (raw_bpm is not None and bpm_lo <= raw_bpm <= bpm_hi)
-            )
-
-            # 峰显著性门
-            try:
-                if valid and ps is not None and 'np' in globals():
-                    idx = np.argpartition(ps, -3)[-3:]
-                    tops = np.sort(ps[idx])
-                    if tops.size >= 2 and tops[-2] > 0:
-                        if (tops[-1] / tops[-2]) < args.prominence_min:
-                            valid = False
-            except Exception:
-                pass
-
-            # 突变抑制门
-            if valid and (last_good_bpm is not None):
-                r = raw_bpm / max(1e-6, last_good_bpm)
-                if (abs(raw_bpm - last_good_bpm) > args.max_step_bpm) or (r > args.max_ratio) or (r < 1/args.max_ratio):
+                # 估计量：一次类型判断取出全部字段
+                raw_bpm, ip, snr_raw, ps = extract(res)
+
+                # ----- 自定义 SNR + 峰显著性（JIT 内核，单次调用） -----
+                snr = None
+                prom_ratio = None
+                try:
+                    if ps is not None:
+                        # 显式 float64 + C 序：处理器给的就是这种布局时零拷贝直通
+                        ps = _asarray(ps, dtype=np.float64, order="C")
+                        k_snr, _peak_i, k_prom = process_frame(ps, snr_min)
+                        if math.isfinite(k_snr):
+                            snr = k_snr
+                        if math.isfinite(k_prom):
+                            prom_ratio = k_prom
+                except Exception:
+                    snr = None
+
+                if snr is None:
+                    snr = snr_raw
+
+                now = time.monotonic()
+
+                # 基础有效性
+                valid = (
+                    (ip is None or ip >= 0.99) and
+                    (snr is None or snr >= snr_min) and
+                    (raw_bpm is not None and bpm_lo <= raw_bpm <= bpm_hi)
+                )
+
+                # 峰显著性门（内核已算好主峰/次峰比）
+                if valid and prom_ratio is not None and prom_ratio < prom_min:
                     valid = False
 
-            # 更新滤波值
-            if valid:
-                q.append(raw_bpm)
-                if args.smooth == "median":
-                    last_good_bpm = sorted(q)[len(q)//2]
-                else:
-                    last_good_bpm = sum(q)/len(q)
-                last_good_t = now
-
-            # 每秒对齐输出（处理可能的漏秒）
-            while now >= next_tick:
-                hms = datetime.now().strftime("%H:%M:%S")
-                unix_s = int(next_tick)
-
-                note = []
-                held = (last_good_bpm is not None) and ((now - last_good_t) <= args.hold_last_for)
-                if held:
-                    out_bpm = f"{last_good_bpm:.2f}"
-                    note.append("held=1")
-                else:
-                    out_bpm = ""
-
-                if snr is not None: note.append(f"snr={snr:.2f}")
-                if ip  is not None: note.append(f"init={ip:.2f}")
-
-                if raw_bpm is not None and not valid and (bpm_lo <= raw_bpm <= bpm_hi):
-                    note.append(f"raw={raw_bpm:.2f}")
-
-                if args.debug:
-                    fe = safe_float(isinstance(res, dict) and res.get("f_est"))
-                    fd = safe_float(isinstance(res, dict) and res.get("f_dft_est"))
-                    if fe is not None: note.append(f"f_est={fe*60:.2f}")
-                    if fd is not None: note.append(f"f_dft={fd*60:.2f}")
-
-                print(f"{hms},{unix_s},{out_bpm},{'/'.join(note)}")
-                if csv_fh:
-                    csv_fh.write(f"{hms},{unix_s},{out_bpm},{'/'.join(note)}\n")
-                next_tick += 1
+                # 突变抑制门
+                if valid and (last_good_bpm is not None):
+                    r = raw_bpm / max(1e-6, last_good_bpm)
+                    if (abs(raw_bpm - last_good_bpm) > max_step) or (r > max_ratio) or (r < inv_max_ratio):
+                        valid = False
+
+                # 更新滤波值
+                if valid:
+                    q.push(raw_bpm)
+                    last_good_bpm = q.median() if use_median else q.mean()
+                    last_good_t = now
+
+                # 每秒对齐输出（处理可能的漏秒）
+                while now >= next_tick:
+                    wall_ts = wall0 + (next_tick - mono0)
+                    hms = _fromtimestamp(wall_ts).strftime("%H:%M:%S")
+                    unix_s = int(round(wall_ts))
+
+                    # note 直接拼字符串：免去每拍的 list 分配 + join
+                    held = (last_good_bpm is not None) and ((now - last_good_t) <= hold_for)
+                    if held:
+                        out_bpm = f"{last_good_bpm:.2f}"
+                        note = "held=1"
+                    else:
+                        out_bpm = ""
+                        note = ""
+
+                    if snr is not None: note = f"{note}/snr={snr:.2f}" if note else f"snr={snr:.2f}"
+                    if ip  is not None: note = f"{note}/init={ip:.2f}" if note else f"init={ip:.2f}"
+
+                    if raw_bpm is not None and not valid and (bpm_lo <= raw_bpm <= bpm_hi):
+                        note = f"{note}/raw={raw_bpm:.2f}" if note else f"raw={raw_bpm:.2f}"
+
+                    if debug and type(res) is dict:
+                        fe = safe_float(res.get("f_est"))
+                        fd = safe_float(res.get("f_dft_est"))
+                        if fe is not None: note = f"{note}/f_est={fe*60:.2f}" if note else f"f_est={fe*60:.2f}"
+                        if fd is not None: note = f"{note}/f_dft={fd*60:.2f}" if note else f"f_dft={fd*60:.2f}"
+
+                    log_q.put(f"{hms},{unix_s},{out_bpm},{note}\n")
+                    next_tick += 1
 
     except KeyboardInterrupt:
         pass
@@ -210,8 +428,12 @@ def main():
         try: client.stop_session()
         except: pass
         client.disconnect()
-        # <-- 在这里关闭文件
+        # <-- 哨兵收尾：等写线程清空队列再关文件
+        log_q.put(None)
+        writer.join(timeout=5)
         if csv_fh:
+            try: os.fsync(csv_fh.fileno())
+            except Exception: pass
             csv_fh.close()
 
 if __name__ == "__main__":
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""v2 热循环的数值内核：一次调用完成峰值定位、噪声中位数 SNR 与峰显著性。
+
+有 numba 时 JIT 编译（cache=True，编译结果落盘复用）；
+没有 numba 的环境（如部分树莓派）退化为解释执行，接口不变。
+"""
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:  # numba 可选依赖：缺失则退化为普通函数
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+        def _wrap(f):
+            return f
+        return _wrap
+
+
+# 注意：不能开 fastmath —— 它假定无 NaN/Inf，会把下面的有限性校验优化掉
+@njit(cache=True)
+def process_frame(ps, snr_floor):
+    """对功率谱做一次完整校验。
+
+    返回 (snr_db, peak_i, prom_ratio)：
+    - snr_db：峰值/噪声近似中位数，dB；不可计算时为 NaN
+    - peak_i：主峰下标；谱无效时为 -1
+    - prom_ratio：主峰/次峰能量比；SNR 低于 snr_floor 时跳过，为 NaN
+    """
+    n = ps.shape[0]
+
+    # 单趟融合：主峰、次大值、有限性校验和噪声副本一次循环完成
+    work = np.empty(n, np.float64)
+    peak_i = -1
+    peak = 0.0
+    second = 0.0
+    for i in range(n):
+        v = ps[i]
+        if not np.isfinite(v):
+            return (np.nan, -1, np.nan)
+        work[i] = v
+        if v > peak:
+            second = peak
+            peak = v
+            peak_i = i
+        elif v > second:
+            second = v
+    if peak_i < 0 or n <= 8:
+        return (np.nan, -1, np.nan)
+
+    # 噪声：剔除主峰邻域后对剩余样本 partition 取中位数（免全排序）。
+    # 注意是压实而不是置零——置零会把中位数挤成第 ~3 小的噪声样本，SNR 系统性偏高
+    lo = peak_i - 2
+    if lo < 0:
+        lo = 0
+    hi = peak_i + 3
+    if hi > n:
+        hi = n
+    width = hi - lo
+    for i in range(hi, n):
+        work[i - width] = work[i]
+    m = n - width
+    k = m // 2
+    part = np.partition(work[:m], k)
+    noise = part[k]
+    if m % 2 == 0 and k > 0:
+        # 偶数个样本与 np.median 对齐：取中间两数的平均
+        lower = part[0]
+        for i in range(1, k):
+            if part[i] > lower:
+                lower = part[i]
+        noise = 0.5 * (lower + noise)
+    snr = np.nan
+    if noise > 0.0:
+        snr = 10.0 * np.log10(peak / noise)
+
+    # SNR 已经确定不过门时显著性不会被用到
+    if np.isfinite(snr) and snr < snr_floor:
+        return (snr, peak_i, np.nan)
+
+    # 峰显著性：主峰 / 全谱次大值
+    prom_ratio = np.nan
+    if second > 0.0:
+        prom_ratio = peak / second
+
+    return (snr, peak_i, prom_ratio)
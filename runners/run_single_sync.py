@@ -1,10 +1,44 @@
-import os, sys, yaml, time, math, signal, subprocess
+import os, sys, yaml, time, math, pickle, shlex, signal, threading
 from datetime import datetime
 from pathlib import Path
 
+# SIGCHLD 事件：子进程状态变化时唤醒主循环，替代 0.5s 轮询
+_child_event = threading.Event()
+
+def _on_sigchld(signum, frame):
+    _child_event.set()
+
+def _reap(live):
+    """非阻塞收割已退出的子进程，从 live（pid -> name）中移除。"""
+    while live:
+        try:
+            pid, _status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            live.clear()
+            return
+        if pid == 0:
+            return
+        live.pop(pid, None)
+
 def load_cfg(path="configs/single.yaml"):
+    # YAML 解析在 Pi 上要几十毫秒，正好卡在同步 T0 的启动关键路径上；
+    # 按 mtime 缓存成 pickle，配置没改时 <1ms 读回
+    cache = path + ".pkl"
+    try:
+        if os.path.getmtime(cache) >= os.path.getmtime(path):
+            with open(cache, "rb") as f:
+                return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        pass
     with open(path, "r") as f:
-        return yaml.safe_load(f)
+        loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)  # 有 libyaml 就走 C 解析
+        cfg = yaml.load(f, Loader=loader)
+    try:
+        with open(cache, "wb") as f:
+            pickle.dump(cfg, f, pickle.HIGHEST_PROTOCOL)
+    except OSError:
+        pass
+    return cfg
 
 def ensure_dir(p: Path):
     p.mkdir(parents=True, exist_ok=True)
@@ -15,27 +49,36 @@ def timestamped_dir(base: str, label_fmt: str):
     ensure_dir(out)
     return out
 
-def build_sleep_then_cmd(cmd: str, start_after_s: float):
-    # 用 bash -lc 执行；sleep 到统一时刻后再 exec 原命令
-    # 这样不动你的脚本，也能做到同步开跑
-    return f"sleep {start_after_s:.3f}; exec {cmd}"
-
-def launch_one(name: str, workdir: str, cmd: str, out_dir: Path, stdout_name: str, stderr_name: str, start_after_s: float):
+def prepare_one(name: str, workdir: str, cmd: str, out_dir: Path, stdout_name: str, stderr_name: str):
+    # 提前打开日志文件、拆好 argv；统一时刻到了直接 posix_spawn，免掉 bash+sleep 中转
     ensure_dir(out_dir)
     stdout_f = open(out_dir / stdout_name, "w")
     stderr_f = open(out_dir / stderr_name, "w")
-    full_cmd = ["bash", "-lc", build_sleep_then_cmd(cmd, start_after_s)]
+    argv = shlex.split(cmd)
     print(f"[{name}] workdir={workdir}")
     print(f"[{name}] cmd={cmd}")
-    print(f"[{name}] scheduled in {start_after_s:.3f}s")
-    p = subprocess.Popen(
-        full_cmd,
-        cwd=workdir,
-        stdout=stdout_f,
-        stderr=stderr_f,
-        preexec_fn=os.setsid  # 便于组信号控制
-    )
-    return p, stdout_f, stderr_f
+    return (name, workdir, argv, stdout_f, stderr_f)
+
+def spawn_one(spec):
+    """用 os.posix_spawnp 启动（一次 exec，不再 fork 整个解释器 + bash）。"""
+    name, workdir, argv, stdout_f, stderr_f = spec
+    fa = [
+        (os.POSIX_SPAWN_DUP2, stdout_f.fileno(), 1),
+        (os.POSIX_SPAWN_DUP2, stderr_f.fileno(), 2),
+    ]
+    cwd0 = os.getcwd()
+    os.chdir(workdir)  # posix_spawn 没有 cwd 参数：父进程临时切过去
+    try:
+        try:
+            pid = os.posix_spawnp(argv[0], argv, os.environ,
+                                  file_actions=fa, setsid=True)
+        except NotImplementedError:
+            # 平台不支持 POSIX_SPAWN_SETSID：退而求其次开新进程组
+            pid = os.posix_spawnp(argv[0], argv, os.environ,
+                                  file_actions=fa, setpgroup=0)
+    finally:
+        os.chdir(cwd0)
+    return pid
 
 def main():
     cfg = load_cfg()
@@ -47,78 +90,93 @@ def main():
 
     start_after_s = float(cfg["sync"]["start_after_s"])
 
-    # 先把两条命令都准备好，再“同时”sleep → exec
-    procs = []
+    # 先把两条命令都准备好，父进程 sleep 到统一时刻后背靠背 spawn
+    specs = []
     files_to_close = []
 
     # RADAR
     radar = cfg["radar"]
-    rp, rso, rse = launch_one(
+    spec = prepare_one(
         name="RADAR",
         workdir=radar["workdir"],
         cmd=radar["cmd"],
         out_dir=out_dir,
         stdout_name=radar["stdout_filename"],
         stderr_name=radar["stderr_filename"],
-        start_after_s=start_after_s
     )
-    procs.append(("RADAR", rp)); files_to_close += [rso, rse]
+    specs.append(spec); files_to_close += [spec[3], spec[4]]
 
     # GDX
     gdx = cfg["gdx"]
-    gp, gso, gse = launch_one(
+    spec = prepare_one(
         name="GDX",
         workdir=gdx["workdir"],
         cmd=gdx["cmd"],
         out_dir=out_dir,
         stdout_name=gdx["stdout_filename"],
         stderr_name=gdx["stderr_filename"],
-        start_after_s=start_after_s
     )
-    procs.append(("GDX", gp)); files_to_close += [gso, gse]
+    specs.append(spec); files_to_close += [spec[3], spec[4]]
 
-    print(f"\n[MASTER] Both processes scheduled. Output folder: {out_dir}")
+    target_t = time.time() + start_after_s
+    print(f"\n[MASTER] Both processes scheduled in {start_after_s:.3f}s. Output folder: {out_dir}")
     print("[MASTER] Press Ctrl+C to stop both.\n")
 
     max_dur = int(cfg.get("run", {}).get("max_duration_s", 0))
-    t0 = time.time()
+
+    signal.signal(signal.SIGCHLD, _on_sigchld)
+    live = {}
+    procs = []
 
     try:
-        while True:
-            all_done = True
-            for name, p in procs:
-                ret = p.poll()
-                if ret is None:
-                    all_done = False
-            if all_done:
+        # 倒计时和 spawn 也在保护区内：这阶段 Ctrl+C 同样走优雅收尾
+        remaining = target_t - time.time()
+        if remaining > 0:
+            time.sleep(remaining)
+        for spec in specs:
+            pid = spawn_one(spec)
+            procs.append((spec[0], pid))
+            live[pid] = spec[0]
+
+        t0 = time.time()
+        deadline = (t0 + max_dur) if max_dur > 0 else None
+
+        while live:
+            # 先清事件再收割，避免丢唤醒
+            _child_event.clear()
+            _reap(live)
+            if not live:
                 break
-            if max_dur > 0 and (time.time() - t0) > max_dur:
+            if deadline is not None and time.time() >= deadline:
                 print("[MASTER] Reached max_duration_s, sending SIGINT to both...")
-                for name, p in procs:
+                for name, pid in procs:
                     try:
-                        os.killpg(os.getpgid(p.pid), signal.SIGINT)
+                        os.killpg(os.getpgid(pid), signal.SIGINT)
                     except Exception as e:
                         print(f"[MASTER] SIGINT {name} error: {e}")
-                break
-            time.sleep(0.5)
+                break  # 交给 finally：5 秒宽限收割，超时 SIGKILL 兜底
+            timeout = None if deadline is None else max(0.0, deadline - time.time())
+            _child_event.wait(timeout)
     except KeyboardInterrupt:
         print("\n[MASTER] Ctrl+C detected, sending SIGINT to both...")
-        for name, p in procs:
+        for name, pid in procs:
             try:
-                os.killpg(os.getpgid(p.pid), signal.SIGINT)
+                os.killpg(os.getpgid(pid), signal.SIGINT)
             except Exception as e:
                 print(f"[MASTER] SIGINT {name} error: {e}")
     finally:
-        # 等子进程收尾
-        for name, p in procs:
+        # 等子进程收尾（waitpid 直接收割；5 秒没退干净的强制杀）
+        grace_until = time.time() + 5.0
+        while live and time.time() < grace_until:
+            _child_event.clear()
+            _reap(live)
+            if live:
+                _child_event.wait(0.2)
+        for pid in list(live):
             try:
-                p.wait(timeout=5)
+                os.killpg(os.getpgid(pid), signal.SIGKILL)
             except Exception:
-                # 若未退出，强制杀
-                try:
-                    os.killpg(os.getpgid(p.pid), signal.SIGKILL)
-                except Exception:
-                    pass
+                pass
         for f in files_to_close:
             try: f.close()
             except: pass